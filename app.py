@@ -1,13 +1,20 @@
 import os
-import json
+import time
+import asyncio
 import logging
-from quart import Quart, jsonify, request, Response, render_template
+import http.cookiejar
+from functools import reduce, lru_cache
+from operator import or_
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from quart import Quart, request, Response, render_template
 import aiosqlite
-import aiohttp
+import httpx
+import orjson
 
 # Configure logging
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
@@ -15,161 +22,540 @@ logger = logging.getLogger(__name__)
 app = Quart(__name__)
 DB_PATH = 'Data/service_workers.db'
 
+# Scopes are stored as a bitmask in the services table
+SCOPE_REQUEST = 1
+SCOPE_RECEIVE = 2
+SCOPE_BITS = {'request': SCOPE_REQUEST, 'receive': SCOPE_RECEIVE}
+
+# Every query is one of these fixed strings so sqlite3's statement cache always hits
+SQL_GET = 'SELECT id, url, scopes FROM services WHERE id = ?'
+SQL_LIST = 'SELECT id, url, scopes FROM services'
+SQL_EXISTS = 'SELECT 1 FROM services WHERE id = ?'
+SQL_INSERT = 'INSERT OR REPLACE INTO services (id, url, scopes) VALUES (?, ?, ?)'
+SQL_DELETE = 'DELETE FROM services WHERE id = ?'
+SQL_PREFIX_MATCH = 'SELECT id, url, scopes FROM services WHERE id IN ({})'
+# Service ids have at most this many '/'-separated segments, which bounds the
+# prefix candidates per proxied path (and the parameters of SQL_PREFIX_MATCH)
+MAX_ID_DEPTH = 32
+# Room for SQL_PREFIX_MATCH at every path depth on top of the fixed statements
+STATEMENT_CACHE_SIZE = 256
+
+# Read-only connections per worker, WAL lets them all read alongside the single writer
+DB_READERS = int(os.environ.get('DB_READERS', 4))
+if DB_READERS < 1:
+    raise ValueError("DB_READERS must be at least 1")
+
+# In-memory LRU cache of service lookups for the proxy path
+# service_id -> (cached_at, service dict or None when not registered)
+SERVICE_CACHE_TTL = 20
+SERVICE_CACHE_SIZE = 1024
+_svc_cache = OrderedDict()
+
+# Serialized /list and /get bodies: (cached_at, payload) and service_id -> (cached_at, payload)
+_list_cache = None
+_get_cache = {}
+
+# Bumped by invalidate(); reads that started before a bump don't fill the caches,
+# since they may have seen the row from before the write
+_cache_generation = 0
+
+# Lookups being run right now: (generation, ids) -> task. Concurrent cold misses for the
+# same ids wait on one query instead of each going to SQLite
+_inflight = {}
+
+# Single registrations are committed together in windows of this many seconds
+COMMIT_INTERVAL = 0.005
+
+# Chunk size used when relaying upstream response bodies
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Hop-by-hop headers (RFC 7230) are never forwarded in either direction
+HOP_BY_HOP_HEADERS = frozenset({
+    'host', 'content-length', 'transfer-encoding', 'connection', 'keep-alive',
+    'proxy-authenticate', 'proxy-authorization', 'te', 'trailers', 'upgrade'
+})
+
+async def open_connection():
+    # Long-lived connection, opened once at startup
+    db = await aiosqlite.connect(DB_PATH, cached_statements=STATEMENT_CACHE_SIZE)
+    db.row_factory = aiosqlite.Row
+
+    await db.execute('PRAGMA synchronous=NORMAL')
+    await db.execute('PRAGMA temp_store=MEMORY')
+    await db.execute('PRAGMA cache_size=-65536')  # 64 MiB
+    await db.execute('PRAGMA mmap_size=268435456')  # 256 MiB, reads come straight from the OS page cache
+    await db.execute('PRAGMA cache_spill=OFF')
+    return db
+
 @app.before_serving
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS services (
-                id TEXT PRIMARY KEY,
-                url TEXT NOT NULL,
-                scopes TEXT NOT NULL
-            )
-        ''')
-        await db.commit()
+    # Single writer connection; writes go through this lock so concurrent requests don't hit SQLITE_BUSY
+    app.writer = await open_connection()
+    app.db_lock = asyncio.Lock()
 
-@app.route('/register', methods=['POST'])
-async def register():
-    data = await request.get_json()
-    
-    if not data:
-        return jsonify({"error": "Invalid JSON"}), 400
+    await app.writer.execute('PRAGMA journal_mode=WAL')
+    await app.writer.execute('''
+        CREATE TABLE IF NOT EXISTS services (
+            id TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            scopes INTEGER NOT NULL
+        )
+    ''')
+    await migrate_scopes()
+    await app.writer.commit()
+
+    # Pool of read-only connections, borrowed per query through reader()
+    app.readers = asyncio.Queue()
+    for _ in range(DB_READERS):
+        db = await open_connection()
+        await db.execute('PRAGMA query_only=1')
+        app.readers.put_nowait(db)
+
+    app.write_queue = asyncio.Queue()
+    app.commit_task = asyncio.create_task(commit_writer())
+
+async def migrate_scopes():
+    # Databases created before the bitmask column store scopes as a JSON list.
+    # Take the write lock first so only one worker migrates, the others see the new table
+    await app.writer.execute('BEGIN IMMEDIATE')
+    async with app.writer.execute("SELECT type FROM pragma_table_info('services') WHERE name = 'scopes'") as cursor:
+        row = await cursor.fetchone()
+    if row['type'] != 'TEXT':
+        return
+
+    logger.info("Migrating service scopes to bitmask column")
+    async with app.writer.execute(SQL_LIST) as cursor:
+        rows = await cursor.fetchall()
+
+    await app.writer.execute('''
+        CREATE TABLE services_new (
+            id TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            scopes INTEGER NOT NULL
+        )
+    ''')
+    migrated = []
+    for row in rows:
+        # Scopes outside the known set were never checked by anything, drop them
+        scopes = [scope for scope in orjson.loads(row['scopes']) if isinstance(scope, str) and scope in SCOPE_BITS]
+        migrated.append((row['id'], row['url'], scopes_to_mask(scopes)))
+    await app.writer.executemany('INSERT INTO services_new (id, url, scopes) VALUES (?, ?, ?)', migrated)
+    await app.writer.execute('DROP TABLE services')
+    await app.writer.execute('ALTER TABLE services_new RENAME TO services')
+
+@app.after_serving
+async def close_db():
+    app.commit_task.cancel()
+    try:
+        await app.commit_task
+    except asyncio.CancelledError:
+        pass
+    await app.writer.close()
+    while not app.readers.empty():
+        await app.readers.get_nowait().close()
+
+@asynccontextmanager
+async def reader():
+    db = await app.readers.get()
+    try:
+        yield db
+    finally:
+        app.readers.put_nowait(db)
+
+async def write_services(rows):
+    # Inserts or replaces (id, url, scopes) rows in a single transaction. The caches are
+    # invalidated here too, so it happens even if the request that asked is gone by now
+    async with app.db_lock:
+        try:
+            await app.writer.executemany(SQL_INSERT, rows)
+            await app.writer.commit()
+        except Exception:
+            await app.writer.rollback()
+            raise
+    invalidate(*(row[0] for row in rows))
+
+async def delete_service(service_id):
+    # Returns False if it wasn't registered; invalidates like write_services
+    async with app.db_lock:
+        async with app.writer.execute(SQL_EXISTS, (service_id,)) as cursor:
+            if not await cursor.fetchone():
+                return False
+
+        await app.writer.execute(SQL_DELETE, (service_id,))
+        await app.writer.commit()
+    invalidate(service_id)
+    return True
+
+async def commit_writer():
+    # Coalesces queued registrations so concurrent requests share one commit
+    while True:
+        batch = [await app.write_queue.get()]
+        await asyncio.sleep(COMMIT_INTERVAL)
+        while not app.write_queue.empty():
+            batch.append(app.write_queue.get_nowait())
+
+        try:
+            await write_services([row for row, _ in batch])
+        except Exception:
+            # Retry one by one so a failing row only fails its own request
+            for row, waiter in batch:
+                try:
+                    await write_services([row])
+                except Exception as e:
+                    _settle(waiter, e)
+                else:
+                    _settle(waiter)
+        else:
+            for _, waiter in batch:
+                _settle(waiter)
+
+def _settle(waiter, error=None):
+    # The request may have gone away while its row was queued
+    if waiter.done():
+        return
+    if error is None:
+        waiter.set_result(None)
+    else:
+        waiter.set_exception(error)
+
+@app.before_serving
+async def init_http():
+    # One pooled client so upstream connections are kept alive between requests,
+    # HTTP/2 upstreams (negotiated over TLS) multiplex concurrent requests on one connection
+    app.http = httpx.AsyncClient(
+        http2=True,
+        # The client is shared by every caller, so it must never keep upstream cookies.
+        # Passed as a bare jar: httpx copies a Cookies object into a default jar, losing the policy
+        cookies=http.cookiejar.CookieJar(policy=http.cookiejar.DefaultCookiePolicy(allowed_domains=[])),
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=75),
+        timeout=30.0,
+        verify=False
+    )
+
+@app.after_serving
+async def close_http():
+    await app.http.aclose()
+
+def scopes_to_mask(scopes):
+    return reduce(or_, (SCOPE_BITS[scope] for scope in scopes), 0)
+
+def mask_to_scopes(mask):
+    return [name for name, bit in SCOPE_BITS.items() if mask & bit]
+
+def json_response(obj, status=200):
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
+
+def error_response(body, status):
+    # For the pre-encoded ERR_* bodies below
+    return Response(body, status=status, mimetype='application/json')
+
+# Proxy rejections are encoded once instead of on every request
+ERR_MISSING_CALLER_HEADER = orjson.dumps({"error": "Unauthorized: Missing X-Service-ID header"})
+ERR_CALLER_NOT_AUTHORIZED = orjson.dumps({"error": "Caller not authorized"})
+ERR_CALLER_MISSING_SCOPE = orjson.dumps({"error": "Caller does not have 'request' scope"})
+ERR_TARGET_NOT_FOUND = orjson.dumps({"error": "Target service not found"})
+ERR_TARGET_MISSING_SCOPE = orjson.dumps({"error": "Target service does not have 'receive' scope"})
+
+def _cache_get(service_id):
+    # Returns (hit, service); expired entries count as a miss
+    entry = _svc_cache.get(service_id)
+    if entry is None:
+        return False, None
+
+    cached_at, service = entry
+    if time.monotonic() - cached_at >= SERVICE_CACHE_TTL:
+        del _svc_cache[service_id]
+        return False, None
+
+    _svc_cache.move_to_end(service_id)
+    return True, service
+
+def _cache_put(service_id, service):
+    _svc_cache[service_id] = (time.monotonic(), service)
+    _svc_cache.move_to_end(service_id)
+    if len(_svc_cache) > SERVICE_CACHE_SIZE:
+        _svc_cache.popitem(last=False)
+
+def _service_from_row(row):
+    return {
+        "id": row['id'],
+        "url": row['url'],
+        "scopes": row['scopes']
+    }
+
+def invalidate(*service_ids):
+    global _list_cache, _cache_generation
+    _cache_generation += 1
+    for service_id in service_ids:
+        _svc_cache.pop(service_id, None)
+        _get_cache.pop(service_id, None)
+    _list_cache = None
+
+@lru_cache(maxsize=128)
+def prefix_match_sql(count):
+    # The same string object per placeholder count, built once
+    return SQL_PREFIX_MATCH.format(', '.join('?' * count))
+
+def prefix_candidates(path):
+    # 'a/b/c' -> ['a/b/c', 'a/b', 'a']; only prefixes of up to MAX_ID_DEPTH segments
+    # can be service ids, so deep paths don't grow the list or the IN (...) query
+    ends = []
+    end = path.find('/')
+    while end != -1 and len(ends) < MAX_ID_DEPTH - 1:
+        ends.append(end)
+        end = path.find('/', end + 1)
+    ends.append(len(path) if end == -1 else end)
+    return [path[:end] for end in reversed(ends)]
+
+def _cached_prefix_match(candidates):
+    # Walks candidates (longest first) through the cache: (resolved, service, index of first miss)
+    for i, candidate in enumerate(candidates):
+        hit, service = _cache_get(candidate)
+        if not hit:
+            return False, None, i
+        if service:
+            return True, service, i
+    return True, None, len(candidates)
+
+def _may_request(caller):
+    return caller is not None and caller['scopes'] & SCOPE_REQUEST
+
+async def _fetch_services(ids):
+    async with reader() as db:
+        async with db.execute(prefix_match_sql(len(ids)), ids) as cursor:
+            return {row['id']: _service_from_row(row) for row in await cursor.fetchall()}
+
+def _shared_fetch(ids):
+    # Keyed by generation too, so a lookup started after a write never joins one from before it
+    key = (_cache_generation, tuple(ids))
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_services(ids))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return task
+
+async def resolve_services(caller_id, candidates):
+    # Returns (caller, target); anything not cached is fetched in a single query,
+    # so there is nothing left to run concurrently between the two
+    caller_hit, caller = _cache_get(caller_id)
+    if caller_hit and not _may_request(caller):
+        # Rejected before the target matters, don't touch the database for it
+        return caller, None
+
+    target_hit, target, first_miss = _cached_prefix_match(candidates)
+    if caller_hit and target_hit:
+        return caller, target
+
+    remaining = [] if target_hit else candidates[first_miss:]
+    ids = remaining if caller_hit else [caller_id, *remaining]
+
+    generation = _cache_generation
+    # Shielded so one waiter disconnecting doesn't cancel the query for the others
+    found = await asyncio.shield(_shared_fetch(ids))
+    fresh = generation == _cache_generation
+
+    if not caller_hit:
+        caller = found.get(caller_id)
+        # Unknown callers aren't cached, a stream of made-up X-Service-IDs would evict everything
+        if fresh and caller is not None:
+            _cache_put(caller_id, caller)
+
+    # Every candidate longer than the match is known not to be registered. Only an
+    # authorized caller gets to cache them, otherwise made-up callers with deep paths
+    # could flush the cache with negative entries
+    cache_targets = fresh and _may_request(caller)
+    for candidate in remaining:
+        target = found.get(candidate)
+        if cache_targets:
+            _cache_put(candidate, target)
+        if target:
+            break
+
+    return caller, target
+
+async def read_json():
+    # Parses the body straight from bytes without keeping it on the request, None if it isn't valid JSON
+    raw = await request.get_data(cache=False)
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return None
+
+def parse_service(data):
+    # Validates a registration body, returns ((id, url, scopes_mask), None) or (None, error)
+    if not data or not isinstance(data, dict):
+        return None, "Invalid JSON"
         
     req_fields = ['id', 'url', 'scopes']
     if not all(field in data for field in req_fields):
         missing_fields = {', '.join(req_fields)}
-        return jsonify({"error": f"Missing required fields: {missing_fields}"}), 400
+        return None, f"Missing required fields: {missing_fields}"
     
     service_id = data['id']
     url = data['url']
     scopes = data['scopes']
 
-    if not isinstance(scopes, list):
-        return jsonify({"error": "Scopes must be a list of strings"}), 400
+    if not isinstance(service_id, str) or not service_id:
+        return None, "Id must be a non-empty string"
+
+    if service_id.count('/') >= MAX_ID_DEPTH:
+        return None, f"Id can have at most {MAX_ID_DEPTH} path segments"
+
+    if not isinstance(url, str) or not url:
+        return None, "Url must be a non-empty string"
+
+    if not isinstance(scopes, list) or not all(isinstance(scope, str) for scope in scopes):
+        return None, "Scopes must be a list of strings"
+
+    unknown_scopes = [scope for scope in scopes if scope not in SCOPE_BITS]
+    if unknown_scopes:
+        return None, f"Unknown scopes: {', '.join(unknown_scopes)}"
+
+    # Store as bitmask
+    return (service_id, url, scopes_to_mask(scopes)), None
+
+@app.route('/register', methods=['POST'])
+async def register():
+    data = await read_json()
 
-    # Store as JSON string
-    scopes_json = json.dumps(scopes)
+    row, error = parse_service(data)
+    if error:
+        return json_response({"error": error}, 400)
+    service_id = row[0]
 
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute(
-                'INSERT OR REPLACE INTO services (id, url, scopes) VALUES (?, ?, ?)',
-                (service_id, url, scopes_json)
-            )
-            await db.commit()
+        # Committed by commit_writer together with any other pending registrations
+        waiter = asyncio.get_running_loop().create_future()
+        await app.write_queue.put((row, waiter))
+        await waiter
         access_url = f"/request/{service_id}"
-        return jsonify({"message": "Service registered successfully", "id": service_id, "access_url": access_url}), 201
+        return json_response({"message": "Service registered successfully", "id": service_id, "access_url": access_url}, 201)
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
+
+@app.route('/register_batch', methods=['POST'])
+async def register_batch():
+    data = await read_json()
+
+    if not isinstance(data, dict) or not isinstance(data.get('services'), list):
+        return json_response({"error": "Body must contain a list of services"}, 400)
+
+    rows = []
+    for index, entry in enumerate(data['services']):
+        row, error = parse_service(entry)
+        if error:
+            return json_response({"error": f"services[{index}]: {error}"}, 400)
+        rows.append(row)
+
+    service_ids = [row[0] for row in rows]
+    try:
+        # Shielded so a client disconnect can't stop it between commit and invalidation
+        await asyncio.shield(write_services(rows))
+        return json_response({"message": "Services registered successfully", "ids": service_ids}, 201)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
 
 @app.route('/unregister/<service_id>', methods=['DELETE'])
 async def unregister(service_id):
     if not service_id:
-        return jsonify({"error": "Missing required field: id"}), 400
+        return json_response({"error": "Missing required field: id"}, 400)
     
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute('SELECT 1 FROM services WHERE id = ?', (service_id,)) as cursor:
-                if not await cursor.fetchone():
-                    return jsonify({"error": "Service not found"}), 404
-            
-            await db.execute('DELETE FROM services WHERE id = ?', (service_id,))
-            await db.commit()
-        return jsonify({"message": "Service unregistered successfully", "id": service_id}), 200
+        # Shielded so a client disconnect can't stop it between commit and invalidation
+        if not await asyncio.shield(delete_service(service_id)):
+            return json_response({"error": "Service not found"}, 404)
+        return json_response({"message": "Service unregistered successfully", "id": service_id}, 200)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
 
 @app.route('/get/<service_id>', methods=['GET'])
 async def get_service(service_id):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        try:
-            async with db.execute('SELECT * FROM services WHERE id = ?', (service_id,)) as cursor:
+    entry = _get_cache.get(service_id)
+    if entry and time.monotonic() - entry[0] < SERVICE_CACHE_TTL:
+        return Response(entry[1], mimetype='application/json')
+
+    try:
+        generation = _cache_generation
+        async with reader() as db:
+            async with db.execute(SQL_GET, (service_id,)) as cursor:
                 row = await cursor.fetchone()
-                if row:
-                    scopes = json.loads(row['scopes'])
-                        
-                    return jsonify({
-                        "id": row['id'],
-                        "url": row['url'],
-                        "scopes": scopes
-                    })
-                else:
-                    return jsonify({"error": "Service not found"}), 404
-        except Exception as e:
-            return jsonify({"error": str(e)}), 500
+        if not row:
+            return json_response({"error": "Service not found"}, 404)
+
+        payload = orjson.dumps({
+            "id": row['id'],
+            "url": row['url'],
+            "scopes": mask_to_scopes(row['scopes'])
+        })
+        if generation == _cache_generation:
+            _get_cache[service_id] = (time.monotonic(), payload)
+        return Response(payload, mimetype='application/json')
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
 
 @app.route('/list', methods=['GET'])
 async def list_services():
+    global _list_cache
+    if _list_cache and time.monotonic() - _list_cache[0] < SERVICE_CACHE_TTL:
+        return Response(_list_cache[1], status=200, mimetype='application/json')
+
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute('SELECT id, url, scopes FROM services') as cursor:
+        generation = _cache_generation
+        async with reader() as db:
+            async with db.execute(SQL_LIST) as cursor:
                 rows = await cursor.fetchall()
-                services = []
-                for row in rows:
-                    services.append({
-                        "id": row['id'],
-                        "url": row['url'],
-                        "scopes": json.loads(row['scopes'])
-                    })
-                return jsonify({"services": services}), 200
+        services = []
+        for row in rows:
+            services.append({
+                "id": row['id'],
+                "url": row['url'],
+                "scopes": mask_to_scopes(row['scopes'])
+            })
+        payload = orjson.dumps({"services": services})
+        if generation == _cache_generation:
+            _list_cache = (time.monotonic(), payload)
+        return Response(payload, status=200, mimetype='application/json')
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
 
 @app.route('/request/<path:request_path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH'])
 async def proxy_request(request_path):
     # The thing trying to request should also be a registered service with a 'request' scope
     caller_id = request.headers.get('X-Service-ID')
-    logger.debug(f"Proxy request: path={request_path}, caller_id={caller_id}, method={request.method}")
+    logger.debug("Proxy request: path=%s, caller_id=%s, method=%s", request_path, caller_id, request.method)
     
     if not caller_id:
-        logger.warning(f"Unauthorized proxy request: missing X-Service-ID header")
-        return jsonify({"error": "Unauthorized: Missing X-Service-ID header"}), 401
+        logger.warning("Unauthorized proxy request: missing X-Service-ID header")
+        return error_response(ERR_MISSING_CALLER_HEADER, 401)
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        
-        # Is it registered with the scopes to make requests
-        async with db.execute('SELECT scopes FROM services WHERE id = ?', (caller_id,)) as cursor:
-            caller_row = await cursor.fetchone()
-            if not caller_row:
-                logger.warning(f"Caller not found: {caller_id}")
-                return jsonify({"error": "Caller not authorized"}), 403
-            
-            caller_scopes = json.loads(caller_row['scopes'])
-       
-            if 'request' not in caller_scopes:
-                logger.warning(f"Caller {caller_id} missing 'request' scope")
-                return jsonify({"error": "Caller does not have 'request' scope"}), 403
-
-        # Match the longest prefix as a service id
-        parts = request_path.split('/')
-        subpath = ""
-        target_row = None
-
-        for i in range(len(parts), 0, -1):
-            potential_id = "/".join(parts[:i])
-            potential_subpath = "/".join(parts[i:])
-            
-            async with db.execute('SELECT url, scopes FROM services WHERE id = ?', (potential_id,)) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    subpath = potential_subpath
-                    target_row = row
-                    logger.debug(f"Found service: id={potential_id}, subpath={subpath}")
-                    break
-        
-        if not target_row:
-            logger.warning(f"Target service not found for path: {request_path}")
-            return jsonify({"error": "Target service not found"}), 404
+    # Candidate service ids for the target, longest prefix first
+    candidates = prefix_candidates(request_path)
+    caller, target = await resolve_services(caller_id, candidates)
 
-        # Get target url and scopes
-        target_url = target_row['url']
-        target_scopes = json.loads(target_row['scopes'])
-        
-        if 'receive' not in target_scopes:
-            logger.warning(f"Target service missing 'receive' scope")
-            return jsonify({"error": "Target service does not have 'receive' scope"}), 403
+    # Is it registered with the scopes to make requests
+    if not caller:
+        logger.warning("Caller not found: %s", caller_id)
+        return error_response(ERR_CALLER_NOT_AUTHORIZED, 403)
+
+    if not caller['scopes'] & SCOPE_REQUEST:
+        logger.warning("Caller %s missing 'request' scope", caller_id)
+        return error_response(ERR_CALLER_MISSING_SCOPE, 403)
+    
+    if not target:
+        logger.warning("Target service not found for path: %s", request_path)
+        return error_response(ERR_TARGET_NOT_FOUND, 404)
+
+    # Whatever follows the matched id is forwarded as the subpath
+    subpath = request_path[len(target['id']) + 1:]
+    logger.debug("Found service: id=%s, subpath=%s", target['id'], subpath)
+
+    # Get target url and scopes
+    target_url = target['url']
+    
+    if not target['scopes'] & SCOPE_RECEIVE:
+        logger.warning("Target service missing 'receive' scope")
+        return error_response(ERR_TARGET_MISSING_SCOPE, 403)
 
     # Make url
     target_url = target_url.rstrip('/')
@@ -178,42 +564,86 @@ async def proxy_request(request_path):
     else:
         dest_url = target_url
     
-    logger.info(f"Proxying {request.method} request to: {dest_url}")
+    logger.info("Proxying %s request to: %s", request.method, dest_url)
     
     method = request.method
     
     # Filter headers to avoid conflicts
-    excluded_headers = {'host', 'content-length', 'transfer-encoding', 'connection', 'keep-alive', 'accept-encoding'}
-    headers = {key: value for key, value in request.headers.items() if key.lower() not in excluded_headers}
-    logger.debug(f"Forwarded headers: {list(headers.keys())}")
+    headers = {key: value for key, value in request.headers.items() if key.lower() not in HOP_BY_HOP_HEADERS}
+    # The body is relayed still encoded, so only ask for encodings the client accepts
+    if 'Accept-Encoding' not in request.headers:
+        headers['Accept-Encoding'] = 'identity'
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Forwarded headers: %s", list(headers.keys()))
     
-    # Get data and params
-    data = await request.get_data()
-    params = request.args
+    # Stream the body through instead of buffering it. It's only known to be empty with an
+    # explicit zero length, or on HTTP/1.x without either framing header; HTTP/2 and 3
+    # stream bodies of unknown length with neither
+    if request.content_length == 0:
+        data = None
+    elif (
+        request.content_length is None
+        and request.http_version.startswith('1')
+        and 'Transfer-Encoding' not in request.headers
+    ):
+        data = None
+    else:
+        data = request.body
 
-    timeout = aiohttp.ClientTimeout(total=30)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
+    # Keep a known length so httpx doesn't switch the streamed body to chunked
+    if data is not None and request.content_length is not None:
+        headers['Content-Length'] = str(request.content_length)
+    params = list(request.args.items(multi=True))
+
+    try:
+        logger.debug("Making request: %s %s", method, dest_url)
+        upstream_request = app.http.build_request(method, dest_url, headers=headers, content=data, params=params)
+        resp = await app.http.send(upstream_request, stream=True)
+    except httpx.RequestError as e:
+        logger.error("Upstream connection error: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+        return json_response({"error": f"Internal upstream error: {str(e)}"}, 502)
+    except Exception as e:
+        logger.error("Proxy error: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+        return json_response({"error": f"Internal proxy error: {str(e)}"}, 500)
+
+    logger.info("Upstream response: status=%s, http_version=%s", resp.status_code, resp.http_version)
+
+    # Relay the upstream body chunk by chunk, the connection goes back to the pool when done
+    async def stream_body():
         try:
-            logger.debug(f"Making request: {method} {dest_url}")
-            async with session.request(method, dest_url, headers=headers, data=data, params=params, ssl=False) as resp:
-                content = await resp.read()
-                logger.info(f"Upstream response: status={resp.status}, content_length={len(content)}")
-                
-                # Quart response
-                response = Response(content, status=resp.status)
-                
-                # Copy headers from upstream response
-                for key, value in resp.headers.items():
-                    if key.lower() not in ('content-encoding', 'content-length', 'transfer-encoding', 'connection'):
-                        response.headers[key] = value
-                        
-                return response
-        except aiohttp.ClientError as e:
-            logger.error(f"Upstream connection error: {str(e)}", exc_info=True)
-            return jsonify({"error": f"Internal upstream error: {str(e)}"}), 502
-        except Exception as e:
-            logger.error(f"Proxy error: {str(e)}", exc_info=True)
-            return jsonify({"error": f"Internal proxy error: {str(e)}"}), 500
+            async for chunk in resp.aiter_raw(STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            await resp.aclose()
+
+    # Copy headers from upstream response, repeated ones like Set-Cookie included
+    response_headers = [(key, value) for key, value in resp.headers.multi_items() if key.lower() not in HOP_BY_HOP_HEADERS]
+
+    # Quart response
+    response = Response(stream_body(), status=resp.status_code, headers=response_headers)
+
+    # Stop nginx (if in front of us) from buffering the streamed body
+    response.headers['X-Accel-Buffering'] = 'no'
+            
+    return response
 
 if __name__ == '__main__':
-    app.run()
\ No newline at end of file
+    from hypercorn.config import Config
+    from hypercorn.run import run
+
+    # Each worker is a separate process with its own database connection,
+    # upstream connection pool and registry caches
+    config = Config()
+    config.application_path = 'app:app'
+    config.bind = [os.environ.get('BIND', '0.0.0.0:8000')]
+    config.workers = int(os.environ.get('WORKERS', os.cpu_count() or 1))
+    config.backlog = 2048
+    config.keep_alive_timeout = 75
+
+    try:
+        import uvloop  # noqa: F401
+        config.worker_class = 'uvloop'
+    except ImportError:
+        config.worker_class = 'asyncio'
+
+    run(config)
\ No newline at end of file
@@ -0,0 +1,102 @@
+import asyncio
+import socket
+
+import pytest
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+from quart import Quart, Response, request
+
+import app as forwarder
+
+# Requests the upstream saw: (path, Cookie header, body)
+seen = []
+
+upstream = Quart('upstream')
+
+@upstream.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH'])
+async def echo(path):
+    body = await request.get_data()
+    seen.append((path, request.headers.get('Cookie'), body))
+    response = Response(b'ok')
+    if path == 'set-cookie':
+        response.set_cookie('a', '1')
+        response.set_cookie('b', '2')
+    return response
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    # Runs a test coroutine as fn(client, upstream_url) against a fresh database and a live upstream
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Data').mkdir()
+    seen.clear()
+    forwarder._svc_cache.clear()
+    forwarder.invalidate()
+
+    async def runner(fn):
+        port = free_port()
+        config = Config()
+        config.bind = [f'127.0.0.1:{port}']
+        shutdown = asyncio.Event()
+        server = asyncio.create_task(serve(upstream, config, shutdown_trigger=shutdown.wait))
+        await asyncio.sleep(0.2)
+        try:
+            async with forwarder.app.test_app():
+                # Without its own cookie jar, so any Cookie the upstream sees came from the forwarder
+                await fn(forwarder.app.test_client(use_cookies=False), f'http://127.0.0.1:{port}')
+        finally:
+            shutdown.set()
+            await server
+
+    return lambda fn: asyncio.run(runner(fn))
+
+async def register(client, service_id, url, scopes):
+    response = await client.post('/register', json={"id": service_id, "url": url, "scopes": scopes})
+    assert response.status_code == 201
+
+async def register_pair(client, upstream_url):
+    await register(client, 'caller', 'http://unused', ['request'])
+    await register(client, 'up', upstream_url, ['receive'])
+
+def test_streams_body_without_length(run):
+    # HTTP/2 requests can stream a body with neither Content-Length nor Transfer-Encoding
+    async def check(client, upstream_url):
+        await register_pair(client, upstream_url)
+        async with client.request(
+            '/request/up/upload', method='POST', headers={'X-Service-ID': 'caller'}, http_version='2'
+        ) as connection:
+            await connection.send(b'x' * 5000)
+            await connection.send_complete()
+        response = await connection.as_response()
+        assert response.status_code == 200
+        assert seen == [('upload', None, b'x' * 5000)]
+
+    run(check)
+
+def test_request_without_body(run):
+    async def check(client, upstream_url):
+        await register_pair(client, upstream_url)
+        response = await client.get('/request/up/plain', headers={'X-Service-ID': 'caller'})
+        assert response.status_code == 200
+        assert seen == [('plain', None, b'')]
+
+    run(check)
+
+def test_upstream_cookies_not_replayed(run):
+    # The shared upstream client must not carry one caller's cookies over to another
+    async def check(client, upstream_url):
+        await register_pair(client, upstream_url)
+        await register(client, 'other', 'http://unused', ['request'])
+        response = await client.get('/request/up/set-cookie', headers={'X-Service-ID': 'caller'})
+        assert response.status_code == 200
+        assert len(response.headers.getlist('Set-Cookie')) == 2
+        for caller in ('caller', 'other'):
+            response = await client.get('/request/up/after', headers={'X-Service-ID': caller})
+            assert response.status_code == 200
+        assert seen == [('set-cookie', None, b''), ('after', None, b''), ('after', None, b'')]
+
+    run(check)